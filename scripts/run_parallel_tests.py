@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Run the unit tests as concurrent pytest shards.
+
+Collects the test node IDs, splits them round-robin into ``cpu_count - 2``
+shards (leaving headroom for the editor/agent process), runs every shard in
+its own pytest process and writes one JUnit report per shard to ``reports/``.
+
+Usage:
+    python scripts/run_parallel_tests.py [TEST_PATH ...]
+"""
+
+import os
+import subprocess
+import sys
+
+DEFAULT_PATHS = ["tests/unit_tests/"]
+REPORTS_DIR = "reports"
+
+
+def collect_node_ids(paths):
+    """Return the node IDs pytest would run for ``paths``."""
+    result = subprocess.run(
+        # Clear addopts: its --verbose would override -q's node ID listing.
+        [sys.executable, "-m", "pytest", "--collect-only", "-q", "-o", "addopts=", *paths],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stdout + result.stderr)
+        sys.exit(result.returncode)
+    
+    return [line for line in result.stdout.splitlines() if "::" in line]
+
+
+def split_round_robin(node_ids, shard_count):
+    """Split node IDs into ``shard_count`` interleaved buckets."""
+    return [node_ids[i::shard_count] for i in range(shard_count)]
+
+
+def main():
+    paths = sys.argv[1:] or DEFAULT_PATHS
+    node_ids = collect_node_ids(paths)
+    if not node_ids:
+        print("No tests collected.")
+        return 0
+    
+    shard_count = min(len(node_ids), max(1, (os.cpu_count() or 1) - 2))
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    
+    # Each shard runs serially (-n 0) since sharding already uses the cores;
+    # coverage is left to the regular `make test` run
+    processes = [
+        subprocess.Popen([
+            sys.executable, "-m", "pytest", "-q", "-n", "0", "--no-cov",
+            f"--junitxml={REPORTS_DIR}/shard_{i}.xml",
+            *bucket,
+        ])
+        for i, bucket in enumerate(split_round_robin(node_ids, shard_count))
+    ]
+    
+    return_codes = [process.wait() for process in processes]
+    failed = [i for i, code in enumerate(return_codes) if code != 0]
+    
+    print(f"\n{shard_count - len(failed)}/{shard_count} shards passed "
+          f"({len(node_ids)} tests, reports in {REPORTS_DIR}/)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
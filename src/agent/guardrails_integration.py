@@ -314,7 +314,7 @@ class SafetyLayer:
         # Run basic validation
         basic_result = self.input_guard.validate(user_input)
         
-        # If basic validation fails, don't proceed
+        # If basic validation fails, don't proceed to the (expensive) Guardrails call
         if not basic_result["is_valid"]:
             logger.warning("Input failed basic validation")
             return basic_result
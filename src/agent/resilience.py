@@ -5,21 +5,35 @@ This module provides retry logic, circuit breakers, timeouts, and error handling
 to make the multi-agent system robust against real-world failures.
 """
 
+import math
+import random
+import threading
 import time
+import weakref
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
-from typing import Callable, Any, Optional, Type, Tuple, Dict
-from datetime import datetime, timedelta
+from typing import Callable, Any, Optional, Type, Tuple, Dict, List, Union
 import asyncio
 
 logger = logging.getLogger(__name__)
 
+# Integer nanosecond clock used by CircuitBreaker and RateLimiter; looked up
+# at call time so tests can substitute a virtual clock instead of sleeping
+_clock: Callable[[], int] = time.monotonic_ns
+_NS_PER_SECOND = 1_000_000_000
+
 
 # ==================== Retry Logic with Exponential Backoff ====================
 
 class RetryConfig:
     """Configuration for retry behavior."""
     
+    __slots__ = (
+        "max_retries", "initial_delay", "max_delay",
+        "exponential_base", "jitter", "_cap_attempt",
+    )
+    
     def __init__(
         self,
         max_retries: int = 3,
@@ -33,6 +47,28 @@ class RetryConfig:
         self.max_delay = max_delay
         self.exponential_base = exponential_base
         self.jitter = jitter
+        self._cap_attempt = self._saturation_attempt()
+    
+    def _saturation_attempt(self) -> float:
+        """First attempt whose exponential delay reaches max_delay."""
+        if self.max_delay <= self.initial_delay:
+            return 0
+        if self.initial_delay <= 0 or self.exponential_base <= 1:
+            return math.inf
+        return math.ceil(
+            math.log(self.max_delay / self.initial_delay, self.exponential_base)
+        )
+
+
+def _capped_delay(attempt: int, config: RetryConfig) -> float:
+    """Exponential delay for ``attempt`` capped at ``config.max_delay``."""
+    if attempt >= config._cap_attempt:
+        # Saturated: skip the exponentiation entirely
+        return config.max_delay
+    return min(
+        config.initial_delay * (config.exponential_base ** attempt),
+        config.max_delay
+    )
 
 
 def calculate_backoff_delay(
@@ -40,7 +76,11 @@ def calculate_backoff_delay(
     config: RetryConfig
 ) -> float:
     """
-    Calculate exponential backoff delay with optional jitter.
+    Calculate exponential backoff delay with optional "full jitter".
+    
+    Without jitter the delay is ``min(max_delay, initial_delay * base**attempt)``.
+    With jitter a uniformly random delay in ``[0, that cap)`` is used, which
+    spreads out retries from concurrent callers.
     
     Args:
         attempt: Current attempt number (0-indexed)
@@ -49,29 +89,53 @@ def calculate_backoff_delay(
     Returns:
         Delay in seconds
     """
-    delay = min(
-        config.initial_delay * (config.exponential_base ** attempt),
-        config.max_delay
-    )
+    delay = _capped_delay(attempt, config)
     
     if config.jitter:
-        import random
-        delay = delay * (0.5 + random.random() * 0.5)
+        delay = random.random() * delay
     
     return delay
 
 
+def calculate_backoff_schedule(
+    config: RetryConfig,
+    n: int
+) -> List[float]:
+    """
+    Calculate the first ``n`` backoff delays in one call.
+    
+    Intended for simulations, planners and property tests that need a whole
+    retry schedule; ``calculate_backoff_delay`` remains the per-retry path.
+    
+    Args:
+        config: Retry configuration
+        n: Number of attempts to schedule
+        
+    Returns:
+        Delays in seconds, one per attempt
+    """
+    delays = [_capped_delay(attempt, config) for attempt in range(n)]
+    
+    if config.jitter:
+        delays = [random.random() * delay for delay in delays]
+    
+    return delays
+
+
 def retry_with_backoff(
     retry_config: Optional[RetryConfig] = None,
-    retryable_exceptions: Tuple[Type[Exception], ...] = (Exception,),
+    retryable_exceptions: Union[Type[Exception], Tuple[Type[Exception], ...]] = (Exception,),
     on_retry: Optional[Callable[[Exception, int], None]] = None
 ):
     """
     Decorator for retrying functions with exponential backoff.
     
+    The backoff schedule is computed once when the decorator is applied, so
+    each retry only samples jitter (if enabled) before sleeping.
+    
     Args:
         retry_config: Retry configuration settings
-        retryable_exceptions: Tuple of exception types to retry on
+        retryable_exceptions: Exception type, or tuple of types, to retry on
         on_retry: Optional callback function called on each retry
         
     Example:
@@ -86,29 +150,27 @@ def retry_with_backoff(
     if retry_config is None:
         retry_config = RetryConfig()
     
+    # Normalize once so the except clauses always match against a prebuilt tuple
+    if not isinstance(retryable_exceptions, tuple):
+        retryable_exceptions = (retryable_exceptions,)
+    
+    max_retries = retry_config.max_retries
+    jitter = retry_config.jitter
+    delay_caps = tuple(_capped_delay(i, retry_config) for i in range(max_retries))
+    
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(*args, **kwargs):
-            last_exception = None
-            
-            for attempt in range(retry_config.max_retries + 1):
+            for attempt, delay in enumerate(delay_caps):
                 try:
                     return func(*args, **kwargs)
                     
                 except retryable_exceptions as e:
-                    last_exception = e
-                    
-                    if attempt == retry_config.max_retries:
-                        logger.error(
-                            f"Function {func.__name__} failed after "
-                            f"{retry_config.max_retries} retries: {e}"
-                        )
-                        raise
-                    
-                    delay = calculate_backoff_delay(attempt, retry_config)
+                    if jitter:
+                        delay = random.random() * delay
                     
                     logger.warning(
-                        f"Attempt {attempt + 1}/{retry_config.max_retries + 1} "
+                        f"Attempt {attempt + 1}/{max_retries + 1} "
                         f"failed for {func.__name__}: {e}. "
                         f"Retrying in {delay:.2f}s..."
                     )
@@ -118,7 +180,14 @@ def retry_with_backoff(
                     
                     time.sleep(delay)
             
-            raise last_exception
+            try:
+                return func(*args, **kwargs)
+            except retryable_exceptions as e:
+                logger.error(
+                    f"Function {func.__name__} failed after "
+                    f"{max_retries} retries: {e}"
+                )
+                raise
         
         return wrapper
     return decorator
@@ -126,6 +195,11 @@ def retry_with_backoff(
 
 # ==================== Circuit Breaker Pattern ====================
 
+class CircuitBreakerOpenError(Exception):
+    """Raised when a circuit breaker rejects a call without executing it."""
+    pass
+
+
 class CircuitBreakerState:
     """States for circuit breaker."""
     CLOSED = "closed"  # Normal operation
@@ -133,6 +207,16 @@ class CircuitBreakerState:
     HALF_OPEN = "half_open"  # Testing if service recovered
 
 
+# Internal int encoding of CircuitBreakerState; the public ``state`` property
+# maps back through _STATE_NAMES with a tuple index
+_CLOSED, _OPEN, _HALF_OPEN = 0, 1, 2
+_STATE_NAMES = (
+    CircuitBreakerState.CLOSED,
+    CircuitBreakerState.OPEN,
+    CircuitBreakerState.HALF_OPEN,
+)
+
+
 class CircuitBreaker:
     """
     Circuit breaker to prevent cascading failures.
@@ -141,6 +225,12 @@ class CircuitBreaker:
     preventing further calls until recovery period passes.
     """
     
+    __slots__ = (
+        "failure_threshold", "recovery_timeout", "expected_exception", "name",
+        "failure_count", "_recovery_ns", "_reopen_deadline", "_state", "_probe_lock",
+        "_open_msg", "_probe_busy_msg",
+    )
+    
     def __init__(
         self,
         failure_threshold: int = 5,
@@ -154,8 +244,22 @@ class CircuitBreaker:
         self.name = name
         
         self.failure_count = 0
-        self.last_failure_time: Optional[datetime] = None
-        self.state = CircuitBreakerState.CLOSED
+        self._recovery_ns = int(recovery_timeout * _NS_PER_SECOND)
+        # Monotonic time (ns) after which an OPEN circuit may be probed again;
+        # only read while OPEN and set whenever the circuit opens
+        self._reopen_deadline = 0
+        self._state = _CLOSED
+        # Try-lock admitting a single recovery probe while HALF_OPEN
+        self._probe_lock = threading.Lock()
+        # Rejection messages are formatted once; rejections are the hot path
+        # during an outage
+        self._open_msg = f"Circuit breaker '{name}' is OPEN. Service is unavailable."
+        self._probe_busy_msg = f"Circuit breaker '{name}' is OPEN. Recovery probe already in flight."
+    
+    @property
+    def state(self) -> str:
+        """Current state as a CircuitBreakerState value."""
+        return _STATE_NAMES[self._state]
     
     def call(self, func: Callable, *args, **kwargs) -> Any:
         """
@@ -169,60 +273,93 @@ class CircuitBreaker:
             Function result
             
         Raises:
-            Exception: If circuit is open or function fails
+            CircuitBreakerOpenError: If the circuit is open
+            Exception: If the function fails
         """
-        if self.state == CircuitBreakerState.OPEN:
-            if self._should_attempt_reset():
-                self.state = CircuitBreakerState.HALF_OPEN
-                logger.info(f"Circuit breaker '{self.name}' entering HALF_OPEN state")
-            else:
-                raise Exception(
-                    f"Circuit breaker '{self.name}' is OPEN. "
-                    f"Service is unavailable."
-                )
+        if self._state != _CLOSED:
+            return self._probe(func, *args, **kwargs)
         
         try:
             result = func(*args, **kwargs)
-            self._on_success()
-            return result
-            
-        except self.expected_exception as e:
+        except self.expected_exception:
             self._on_failure()
             raise
+        
+        # Already CLOSED: only write shared state when there is a streak to clear
+        if self.failure_count:
+            self.failure_count = 0
+        return result
+    
+    def _probe(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Admit exactly one recovery call once the recovery timeout has passed.
+        
+        Concurrent callers arriving while the probe is in flight are rejected
+        immediately instead of piling onto a recovering service.
+        """
+        if self._state == _OPEN and not self._should_attempt_reset():
+            raise CircuitBreakerOpenError(self._open_msg)
+        
+        if not self._probe_lock.acquire(blocking=False):
+            raise CircuitBreakerOpenError(self._probe_busy_msg)
+        
+        try:
+            if self._state == _OPEN:
+                self._state = _HALF_OPEN
+                logger.info(f"Circuit breaker '{self.name}' entering HALF_OPEN state")
+            
+            try:
+                result = func(*args, **kwargs)
+            except self.expected_exception:
+                self._on_failure()
+                raise
+            except BaseException:
+                # Not counted as a service failure, but the probe proved
+                # nothing either: reopen rather than stay HALF_OPEN
+                self._trip()
+                logger.warning(
+                    f"Circuit breaker '{self.name}' probe raised an unexpected "
+                    f"exception. Reopening circuit."
+                )
+                raise
+            
+            self._on_success()
+            return result
+        finally:
+            self._probe_lock.release()
     
     def _should_attempt_reset(self) -> bool:
         """Check if enough time has passed to attempt reset."""
-        if self.last_failure_time is None:
-            return True
-        
-        time_since_failure = datetime.now() - self.last_failure_time
-        return time_since_failure.total_seconds() >= self.recovery_timeout
+        return _clock() >= self._reopen_deadline
     
     def _on_success(self):
         """Handle successful call."""
-        if self.state == CircuitBreakerState.HALF_OPEN:
+        if self._state == _HALF_OPEN:
             logger.info(f"Circuit breaker '{self.name}' recovered. Closing circuit.")
         
         self.failure_count = 0
-        self.state = CircuitBreakerState.CLOSED
+        self._state = _CLOSED
     
     def _on_failure(self):
         """Handle failed call."""
         self.failure_count += 1
-        self.last_failure_time = datetime.now()
         
         if self.failure_count >= self.failure_threshold:
-            self.state = CircuitBreakerState.OPEN
+            self._trip()
             logger.error(
                 f"Circuit breaker '{self.name}' OPENED after "
                 f"{self.failure_count} failures"
             )
     
+    def _trip(self):
+        """Open the circuit and start a new recovery timeout."""
+        self._state = _OPEN
+        self._reopen_deadline = _clock() + self._recovery_ns
+    
     def reset(self):
         """Manually reset circuit breaker."""
         self.failure_count = 0
-        self.state = CircuitBreakerState.CLOSED
-        self.last_failure_time = None
+        self._state = _CLOSED
         logger.info(f"Circuit breaker '{self.name}' manually reset")
 
 
@@ -310,9 +447,20 @@ class FallbackChain:
     Executes primary function, and if it fails, tries fallbacks in sequence.
     """
     
+    __slots__ = ("primary", "fallbacks", "_functions")
+    
     def __init__(self, primary: Callable, *fallbacks: Callable):
         self.primary = primary
         self.fallbacks = fallbacks
+        # The chain is fixed at construction, so resolve names/labels once
+        self._functions = tuple(
+            (
+                getattr(func, '__name__', f'function_{i}'),
+                'primary' if i == 0 else f'fallback {i}',
+                func,
+            )
+            for i, func in enumerate((primary, *fallbacks))
+        )
     
     def execute(self, *args, **kwargs) -> Any:
         """
@@ -327,28 +475,22 @@ class FallbackChain:
         Raises:
             Exception: If all functions fail
         """
-        functions = [self.primary] + list(self.fallbacks)
         last_exception = None
         
-        for i, func in enumerate(functions):
+        for func_name, role, func in self._functions:
             try:
-                func_name = getattr(func, '__name__', f'function_{i}')
-                logger.info(
-                    f"Attempting function {func_name} "
-                    f"({'primary' if i == 0 else f'fallback {i}'})"
-                )
+                logger.info(f"Attempting function {func_name} ({role})")
                 result = func(*args, **kwargs)
                 
-                if i > 0:
+                if last_exception is not None:
                     logger.warning(
-                        f"Primary function failed, succeeded with fallback {i}"
+                        f"Primary function failed, succeeded with {role}"
                     )
                 
                 return result
                 
             except Exception as e:
                 last_exception = e
-                func_name = getattr(func, '__name__', f'function_{i}')
                 logger.warning(
                     f"Function {func_name} failed: {e}. "
                     f"Trying next fallback..."
@@ -363,8 +505,19 @@ class FallbackChain:
 class RateLimiter:
     """
     Simple rate limiter using token bucket algorithm.
+    
+    The bucket holds up to ``max_calls`` tokens and refills continuously at
+    ``max_calls / time_window`` tokens per second, so each check is O(1).
+    
+    Internally the bucket is kept in integer units of ``1 / window_ns`` token,
+    so refills are exact integer arithmetic on nanosecond timestamps.
     """
     
+    __slots__ = (
+        "max_calls", "time_window", "last_refill",
+        "_window_ns", "_capacity", "_units", "_lock",
+    )
+    
     def __init__(self, max_calls: int, time_window: float):
         """
         Initialize rate limiter.
@@ -372,26 +525,42 @@ class RateLimiter:
         Args:
             max_calls: Maximum number of calls allowed
             time_window: Time window in seconds
+            
+        Raises:
+            ValueError: If time_window is shorter than one nanosecond
         """
+        self._window_ns = int(time_window * _NS_PER_SECOND)
+        if self._window_ns <= 0:
+            raise ValueError(f"time_window must be positive, got {time_window}")
+        
         self.max_calls = max_calls
         self.time_window = time_window
-        self.calls: list = []
+        # One token is _window_ns units; each elapsed ns adds max_calls units
+        self._capacity = max_calls * self._window_ns
+        self._units = self._capacity
+        self.last_refill = _clock()
+        self._lock = threading.Lock()
+    
+    @property
+    def tokens(self) -> float:
+        """Tokens currently available (as of the last check)."""
+        return self._units / self._window_ns
     
     def is_allowed(self) -> bool:
         """Check if a new call is allowed."""
-        now = time.time()
-        
-        # Remove old calls outside time window
-        self.calls = [
-            call_time for call_time in self.calls
-            if now - call_time < self.time_window
-        ]
-        
-        if len(self.calls) < self.max_calls:
-            self.calls.append(now)
-            return True
-        
-        return False
+        with self._lock:
+            now = _clock()
+            self._units = min(
+                self._capacity,
+                self._units + (now - self.last_refill) * self.max_calls
+            )
+            self.last_refill = now
+            
+            if self._units >= self._window_ns:
+                self._units -= self._window_ns
+                return True
+            
+            return False
     
     def wait_if_needed(self):
         """Wait if rate limit is exceeded."""
@@ -435,32 +604,109 @@ def log_execution_time(func: Callable) -> Callable:
     return wrapper
 
 
+_HEALTH_CHECK_MAX_WORKERS = 32
+
+
 class HealthCheck:
     """
     Health check utility for monitoring system components.
+    
+    Checks are typically independent I/O probes (database ping, LLM ping), so
+    ``run_all`` fans them out over a lazily created thread pool and its latency
+    is bounded by the slowest check rather than the sum of all checks.
+    ``is_healthy`` instead runs them in order and stops at the first failure.
     """
     
+    # __weakref__ is needed for the weakref.finalize pool cleanup
+    __slots__ = ("_names", "_fns", "_pool", "_finalizer", "__weakref__")
+    
     def __init__(self):
-        self.checks: Dict[str, Callable[[], bool]] = {}
+        # Parallel lists: _fns[i] is the check registered as _names[i]
+        self._names: list[str] = []
+        self._fns: list[Callable[[], bool]] = []
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._finalizer: Optional[weakref.finalize] = None
     
-    def register(self, name: str, check_func: Callable[[], bool]):
-        """Register a health check function."""
-        self.checks[name] = check_func
+    @property
+    def checks(self) -> Dict[str, Callable[[], bool]]:
+        """Registered (exception-guarded) checks keyed by name, as a snapshot."""
+        return dict(zip(self._names, self._fns))
     
-    def run_all(self) -> Dict[str, bool]:
-        """Run all registered health checks."""
-        results = {}
+    def register(
+        self,
+        name: str,
+        check_func: Callable[[], bool],
+        expected_exceptions: Tuple[Type[Exception], ...] = (Exception,)
+    ):
+        """
+        Register a health check function, replacing any check with the same name.
         
-        for name, check_func in self.checks.items():
-            try:
-                results[name] = check_func()
-            except Exception as e:
-                logger.error(f"Health check '{name}' failed: {e}")
-                results[name] = False
+        Args:
+            name: Component name reported in the results
+            check_func: Zero-argument callable returning True when healthy
+            expected_exceptions: Exceptions that mark the component unhealthy
+                instead of propagating out of ``run_all``/``is_healthy``
+        """
+        wrapped = _guarded_check(name, check_func, expected_exceptions)
+        if name in self._names:
+            self._fns[self._names.index(name)] = wrapped
+        else:
+            self._names.append(name)
+            self._fns.append(wrapped)
+    
+    def _get_pool(self) -> ThreadPoolExecutor:
+        """Return the worker pool, creating it on first use."""
+        if self._pool is None:
+            # Fixed cap rather than len(self._fns): the pool outlives later
+            # register() calls, and idle workers are only spawned on demand
+            self._pool = ThreadPoolExecutor(
+                max_workers=_HEALTH_CHECK_MAX_WORKERS,
+                thread_name_prefix="hc"
+            )
+            self._finalizer = weakref.finalize(self, self._pool.shutdown, wait=False)
+        return self._pool
+    
+    def run_all(self) -> Dict[str, bool]:
+        """Run all registered health checks concurrently."""
+        if not self._fns:
+            return {}
         
-        return results
+        results = self._get_pool().map(_call, self._fns)
+        return dict(zip(self._names, results))
     
     def is_healthy(self) -> bool:
-        """Check if all components are healthy."""
-        results = self.run_all()
-        return all(results.values())
+        """
+        Check if all components are healthy.
+        
+        Checks run sequentially in registration order and stop at the first
+        failure, so cheap checks registered first can spare the expensive ones.
+        """
+        return all(check() for check in self._fns)
+    
+    def close(self):
+        """Shut down the worker pool."""
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self._pool = None
+
+
+def _call(check: Callable[[], bool]) -> bool:
+    """Invoke a guarded check (module-level so ``pool.map`` can use it)."""
+    return check()
+
+
+def _guarded_check(
+    name: str,
+    check_func: Callable[[], bool],
+    expected_exceptions: Tuple[Type[Exception], ...]
+) -> Callable[[], bool]:
+    """Bind a health check to its exception handling once, at registration."""
+    def check() -> bool:
+        try:
+            return bool(check_func())
+        except expected_exceptions as e:
+            logger.error(f"Health check '{name}' failed: {e}")
+            return False
+    
+    return check
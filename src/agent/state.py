@@ -2,6 +2,8 @@
 State management for the multi-agent supervisor system.
 """
 
+import time
+from types import MappingProxyType
 from langgraph.graph import MessagesState
 from typing import Dict, Any, Optional
 from typing_extensions import TypedDict
@@ -129,17 +131,23 @@ class LoopDetector:
         return False, ""
 
 
+# Immutable defaults shared by every initial state; mutable fields and the
+# timestamp are filled in per call by get_initial_state()
+_DEFAULT_STATE_TEMPLATE = MappingProxyType({
+    "iteration_count": 0,
+    "max_iterations": 50,
+    "last_agent": None,
+    "loop_detected": False,
+    "execution_time": 0.0,
+})
+
+
 # For compatibility and future extensions
 def get_initial_state() -> Dict[str, Any]:
     """Get initial state configuration."""
-    import time
     return {
         "messages": [],
-        "iteration_count": 0,
-        "max_iterations": 50,
         "agent_call_history": [],
-        "last_agent": None,
-        "loop_detected": False,
+        **_DEFAULT_STATE_TEMPLATE,
         "start_timestamp": time.time(),
-        "execution_time": 0.0,
-    }
\ No newline at end of file
+    }
@@ -40,6 +40,9 @@ FORBIDDEN_KEYWORDS = {
     "has been denied", "not authorized", "verify you are a human"
 }
 
+# Maximum length of a Wikipedia page excerpt used as a fallback summary
+WIKI_TRUNCATE_LEN = 500
+
 @tool
 def web_search(query: str, max_results: int = 5) -> Dict[str, List[Dict[str, str]]]:
     """
@@ -112,7 +115,7 @@ def wiki_search(topic: str, max_results: int = 5) -> dict:
         results = [
           {
             "title": doc.metadata.get("title", "Unknown"),
-            "summary": doc.metadata.get("summary", doc.page_content[:500] if doc.page_content else "No summary available"),
+            "summary": doc.metadata.get("summary", doc.page_content[:WIKI_TRUNCATE_LEN] if doc.page_content else "No summary available"),
             "source": doc.metadata.get("source", "")
           }
           for doc in raw
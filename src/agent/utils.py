@@ -2,20 +2,26 @@
 Enhanced utility functions with SVG fallback for graph visualization.
 """
 
+import hashlib
 import os
 import time
 import random
+import uuid
+import weakref
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from typing import Optional
-from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.messages import ToolMessage
 from typing import List, Annotated
 from textwrap import dedent
 from langchain_core.tools import tool, BaseTool, InjectedToolCallId
-from langchain_core.messages import ToolMessage
 from langgraph.types import Command
 from langgraph.prebuilt import InjectedState
 
 
-def save_graph_image(graph, filename: str, max_retries: int = 2, retry_delay: float = 2.0) -> Optional[str]:
+def save_graph_image(graph, filename: str, max_retries: int = 2, retry_delay: float = 2.0,
+                     force: bool = True) -> Optional[str]:
     """
     Save graph visualization with retry logic and SVG fallback.
     
@@ -24,6 +30,8 @@ def save_graph_image(graph, filename: str, max_retries: int = 2, retry_delay: fl
         filename: Name for the output file (without extension)
         max_retries: Maximum number of retry attempts
         retry_delay: Base delay between retries in seconds
+        force: Overwrite an existing PNG. If False, a non-empty existing PNG
+            is kept and its path returned without rendering.
         
     Returns:
         str: Path to the saved image file, or None if all attempts failed
@@ -32,6 +40,10 @@ def save_graph_image(graph, filename: str, max_retries: int = 2, retry_delay: fl
     os.makedirs("images", exist_ok=True)
     filepath = f"images/{filename}.png"
     
+    if not force and _png_is_cached(filepath):
+        print(f"✅ Image already exists: {filename}")
+        return filepath
+    
     print(f"🎨 Generating graph image: {filename}")
     
     # Try PNG generation with retries
@@ -41,8 +53,9 @@ def save_graph_image(graph, filename: str, max_retries: int = 2, retry_delay: fl
             graph_png = graph.get_graph().draw_mermaid_png()
             
             # Save to file
-            with open(filepath, "wb") as f:
-                f.write(graph_png)
+            if not _publish_png(graph_png, filepath, overwrite=force):
+                print(f"✅ Image already exists: {filename}")
+                return filepath
             
             print(f"✅ Graph saved successfully: {filename}")
             return filepath
@@ -61,6 +74,56 @@ def save_graph_image(graph, filename: str, max_retries: int = 2, retry_delay: fl
     return _generate_svg_fallback(graph, filename)
 
 
+def _png_is_cached(filepath: str) -> bool:
+    """Return True if ``filepath`` exists and is non-empty (a usable render)."""
+    try:
+        return os.stat(filepath).st_size > 0
+    except FileNotFoundError:
+        return False
+
+
+def _publish_png(data: bytes, filepath: str, overwrite: bool) -> bool:
+    """
+    Write ``data`` to a temp file next to ``filepath`` and move it into place.
+    
+    Readers never see a partially written PNG, and a crash mid-write leaves
+    only a stray ``.tmp`` file rather than a truncated image.
+    
+    Args:
+        data: PNG bytes
+        filepath: Final image path
+        overwrite: Replace an existing image. If False, the image is linked
+            into place only if no other writer published one first; an empty
+            leftover file is replaced.
+        
+    Returns:
+        bool: False if another writer's non-empty image was kept instead
+    """
+    tmp_path = f"{filepath}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    
+    try:
+        if not overwrite:
+            try:
+                # os.link fails instead of clobbering an existing file
+                os.link(tmp_path, filepath)
+                return True
+            except FileExistsError:
+                if _png_is_cached(filepath):
+                    return False
+            except OSError:
+                # No hard-link support on this filesystem; replace instead
+                pass
+        os.replace(tmp_path, filepath)
+        return True
+    finally:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+
 def _generate_svg_fallback(graph, filename: str) -> Optional[str]:
     """Generate SVG visualization as fallback when PNG fails."""
     print(f"🔄 Generating SVG fallback for {filename}")
@@ -294,13 +357,22 @@ def print_messages(messages, truncate_length=200):
             message.pretty_print()
 
 
+_AGENT_NAME_TRANSLATION = str.maketrans({" ": "_"})
+
+
+@lru_cache(maxsize=256)
 def _normalize_agent_name(agent_name: str) -> str:
     """Convert an agent name to a valid tool name format (snake_case)."""
-    return agent_name.replace(" ", "_").lower()
+    return agent_name.lower().translate(_AGENT_NAME_TRANSLATION)
 
 
+@lru_cache(maxsize=64)
 def create_handoff_tool(*, agent_name: str, name: str | None = None, description: str | None = None) -> BaseTool:
-    """Create a tool that transfers control to another agent with specific task instructions."""
+    """
+    Create a tool that transfers control to another agent with specific task instructions.
+    
+    Results are cached, so the same arguments return the same tool instance.
+    """
     if name is None:
         name = f"transfer_to_{_normalize_agent_name(agent_name)}"
     if description is None:
@@ -337,10 +409,22 @@ def create_handoff_tool(*, agent_name: str, name: str | None = None, description
     return handoff_to_agent
 
 
+# Rendered PNGs keyed by the SHA-256 of their Mermaid source. The source is
+# deterministic for a given topology, so entries never go stale.
+_MERMAID_CACHE: dict[bytes, bytes] = {}
+
+# Rendered PNGs keyed by the graph object itself, so repeat renders of the same
+# graph skip even the Mermaid source step. Entries go away with the graph.
+_GRAPH_PNG_CACHE: "weakref.WeakKeyDictionary[object, bytes]" = weakref.WeakKeyDictionary()
+
+
 def get_graph_image_bytes(graph, filename_hint: str = "graph"):
     """
     Get graph visualization as bytes for Streamlit display.
     
+    Renders are cached per graph object and by Mermaid source, so repeated
+    calls for the same graph or topology skip the slow PNG pipeline.
+    
     Args:
         graph: LangGraph graph object
         filename_hint: Hint about the graph type
@@ -351,8 +435,34 @@ def get_graph_image_bytes(graph, filename_hint: str = "graph"):
     print(f"🎨 Getting graph bytes for Streamlit")
     
     try:
-        graph_png = graph.get_graph().draw_mermaid_png()
-        print(f"✅ Graph bytes generated successfully")
+        try:
+            graph_png = _GRAPH_PNG_CACHE.get(graph)
+        except TypeError:
+            # Not weak-referenceable; rely on the source cache only
+            graph_png = None
+        
+        if graph_png is not None:
+            print(f"✅ Graph bytes served from cache")
+        else:
+            drawable = graph.get_graph()
+            source = drawable.draw_mermaid()
+            key = hashlib.sha256(source.encode()).digest() if isinstance(source, str) else None
+            
+            graph_png = _MERMAID_CACHE.get(key)
+            if graph_png is not None:
+                print(f"✅ Graph bytes served from cache")
+            else:
+                graph_png = drawable.draw_mermaid_png()
+                if key is not None and graph_png is not None:
+                    _MERMAID_CACHE[key] = graph_png
+                print(f"✅ Graph bytes generated successfully")
+            
+            if graph_png is not None:
+                try:
+                    _GRAPH_PNG_CACHE[graph] = graph_png
+                except TypeError:
+                    pass
+        
         return graph_png
         
     except Exception as e:
@@ -360,6 +470,35 @@ def get_graph_image_bytes(graph, filename_hint: str = "graph"):
         return None
 
 
+def _exists_batch(paths: List[str]) -> dict[str, bool]:
+    """
+    Check which of ``paths`` exist with one directory listing per parent.
+    
+    Empty files are reported as missing: they are left behind by renders
+    that were interrupted mid-write.
+    
+    Args:
+        paths: File paths to check
+        
+    Returns:
+        dict: {path: exists} for every path given
+    """
+    by_dir = defaultdict(list)
+    for path in paths:
+        by_dir[os.path.dirname(path) or "."].append(path)
+    
+    result = {}
+    for directory, dir_paths in by_dir.items():
+        try:
+            entries = {entry.name: entry for entry in os.scandir(directory)}
+        except FileNotFoundError:
+            entries = {}
+        for path in dir_paths:
+            entry = entries.get(os.path.basename(path))
+            result[path] = entry is not None and entry.stat().st_size > 0
+    return result
+
+
 def ensure_images_exist(graph_dict: dict, force_recreate: bool = False):
     """
     Ensure all graph images exist in the images folder.
@@ -370,14 +509,35 @@ def ensure_images_exist(graph_dict: dict, force_recreate: bool = False):
     """
     print("🖼️ Ensuring graph images exist...")
     
-    for filename, graph in graph_dict.items():
-        filepath = f"images/{filename}.png"
-        svg_filepath = f"images/{filename}.svg"
-        
-        if force_recreate or not (os.path.exists(filepath) or os.path.exists(svg_filepath)):
-            print(f"Creating image: {filename}")
-            save_graph_image(graph, filename)
-        else:
-            print(f"✅ Image already exists: {filename}")
+    if force_recreate:
+        missing = list(graph_dict.items())
+    else:
+        # PNGs and SVG fallbacks share images/, so one listing covers both
+        exists = _exists_batch(
+            [f"images/{filename}.{ext}" for filename in graph_dict for ext in ("png", "svg")]
+        )
+        missing = []
+        for filename, graph in graph_dict.items():
+            if exists[f"images/{filename}.png"] or exists[f"images/{filename}.svg"]:
+                print(f"✅ Image already exists: {filename}")
+            else:
+                missing.append((filename, graph))
+    
+    if not missing:
+        print("🎨 All images ready!")
+        return
+    
+    if len(missing) == 1:
+        filename, graph = missing[0]
+        save_graph_image(graph, filename, force=force_recreate)
+    else:
+        # Renders are dominated by mermaid/browser startup, so overlap them
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            futures = [
+                executor.submit(save_graph_image, graph, filename, force=force_recreate)
+                for filename, graph in missing
+            ]
+            for future in as_completed(futures):
+                future.result()
 
     print("🎨 All images ready!")
\ No newline at end of file
@@ -0,0 +1,237 @@
+"""
+Shared fixtures for unit tests.
+"""
+
+import json
+import pytest
+from functools import lru_cache
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock, Mock, mock_open
+
+
+# ==================== Session Fixtures ====================
+
+@pytest.fixture(scope="session", autouse=True)
+def _preload_agent_modules():
+    """
+    Import the heavy agent modules once per session (once per xdist worker).
+    
+    ``agent.tools`` and ``agent.utils`` pull in langchain, langgraph and the
+    data-provider SDKs; loading them up front keeps that cost out of the
+    first test that happens to touch them.
+    """
+    import agent.tools  # noqa: F401
+    import agent.utils  # noqa: F401
+
+
+# ==================== Guardrails Fixtures ====================
+
+def _passthrough_validate(value, *args, **kwargs):
+    """Mimic a Guardrails outcome that accepts the value unchanged."""
+    return SimpleNamespace(validated_output=value, validation_passed=True)
+
+
+@pytest.fixture(autouse=True)
+def _stub_guard(request, monkeypatch):
+    """
+    Replace ``guardrails.Guard`` with a lightweight stub for guardrails tests.
+
+    Building a real Guard parses schemas and may reach the Guardrails Hub,
+    which none of the behavioral tests need. Tests marked ``real_guard``
+    keep the real implementation.
+    """
+    if "guardrails" not in request.keywords or "real_guard" in request.keywords:
+        return
+
+    guard_class = MagicMock(name="Guard")
+    guard_class.return_value.validate.side_effect = _passthrough_validate
+    monkeypatch.setattr("agent.guardrails_integration.Guard", guard_class)
+
+
+# ==================== Resilience Fixtures ====================
+
+class CountingRaiser:
+    """Callable that raises ``exc`` for the first ``n_fail`` calls, then returns ``then``."""
+    
+    __slots__ = ("exc", "n_fail", "then", "call_count")
+    
+    def __init__(self, exc, n_fail, then=None):
+        self.exc = exc
+        self.n_fail = n_fail
+        self.then = then
+        self.call_count = 0
+    
+    def __call__(self, *args, **kwargs):
+        attempt = self.call_count
+        self.call_count += 1
+        if attempt < self.n_fail:
+            raise self.exc(f"fail {attempt}")
+        return self.then
+
+
+@pytest.fixture
+def counting_raiser():
+    """Factory for lightweight failing callables (cheaper than Mock side_effect)."""
+    return CountingRaiser
+
+
+class CountingCallable:
+    """Callable that forwards to ``fn`` and counts how often it was called."""
+    
+    __slots__ = ("fn", "call_count")
+    
+    def __init__(self, fn):
+        self.fn = fn
+        self.call_count = 0
+    
+    def __call__(self, *args, **kwargs):
+        self.call_count += 1
+        return self.fn(*args, **kwargs)
+
+
+def _ok_check():
+    return True
+
+
+def _fail_check():
+    raise RuntimeError("down")
+
+
+@pytest.fixture
+def ok_check():
+    """Health check that always reports healthy."""
+    return _ok_check
+
+
+@pytest.fixture
+def fail_check():
+    """Health check that always raises."""
+    return _fail_check
+
+
+@pytest.fixture
+def counting_callable():
+    """Factory wrapping a function to count calls (cheaper than Mock)."""
+    return CountingCallable
+
+
+# ==================== Tool Fixtures ====================
+
+@pytest.fixture
+def externals(mocker):
+    """Patch the external services used by ``agent.tools`` for one test."""
+    return SimpleNamespace(
+        tavily=mocker.patch("agent.tools.TavilySearch"),
+        wiki=mocker.patch("agent.tools.WikipediaLoader"),
+        yf=mocker.patch("agent.tools.yf.Ticker"),
+        req=mocker.patch("agent.tools.requests.get"),
+    )
+
+
+def _make_response(payload):
+    response = MagicMock()
+    response.json.return_value = payload
+    return response
+
+
+@pytest.fixture
+def make_response():
+    """
+    Factory for ``requests`` responses whose ``json()`` returns ``payload``.
+    
+    ``raise_for_status`` is auto-created by MagicMock and does nothing.
+    """
+    return _make_response
+
+
+CASSETTE_DIR = Path(__file__).parent / "cassettes"
+
+
+@lru_cache(maxsize=None)
+def _load_cassette(name):
+    return json.loads((CASSETTE_DIR / f"{name}.json").read_text())
+
+
+@pytest.fixture
+def cassette():
+    """
+    Loader for recorded API payloads stored under ``cassettes/``.
+    
+    Payloads are parsed once per session and shared, so treat them as
+    read-only.
+    """
+    return _load_cassette
+
+
+@pytest.fixture
+def order_db(mocker):
+    """
+    Patch the database tools ``place_order`` writes through.
+    
+    ``insert.func`` returns order ``ORD-1`` by default; tests override it to
+    simulate other database responses.
+    """
+    insert = mocker.patch("agent.database_tools.insert_order")
+    insert.func.return_value = {"order_id": "ORD-1", "database_id": 1}
+    return SimpleNamespace(
+        insert=insert,
+        update=mocker.patch("agent.database_tools.update_order_status"),
+    )
+
+
+# ==================== Utils Fixtures ====================
+
+@pytest.fixture
+def utils_open(mocker):
+    """
+    Patch ``open`` inside ``agent.utils`` only.
+    
+    Narrower than patching ``builtins.open``, so pytest's own report and
+    coverage file I/O is never intercepted.
+    """
+    return mocker.patch("agent.utils.open", mock_open(), create=True)
+
+
+@pytest.fixture
+def make_mock_graph():
+    """Factory for graph mocks whose ``draw_mermaid_png`` returns ``png``."""
+    def _make(png=b"fake_png_data"):
+        graph = MagicMock()
+        graph.get_graph.return_value.draw_mermaid_png.return_value = png
+        return graph
+    
+    return _make
+
+
+@pytest.fixture
+def graph_io(mocker, utils_open):
+    """
+    Patch the filesystem touch points of ``save_graph_image`` in one place.
+    
+    ``open`` receives the temp file write; ``link``/``replace`` publish it and
+    ``stat`` reports no existing PNG unless a test overrides it.
+    """
+    return SimpleNamespace(
+        open=utils_open,
+        makedirs=mocker.patch("agent.utils.os.makedirs"),
+        stat=mocker.patch("agent.utils.os.stat", side_effect=FileNotFoundError),
+        link=mocker.patch("agent.utils.os.link"),
+        replace=mocker.patch("agent.utils.os.replace"),
+        remove=mocker.patch("agent.utils.os.remove"),
+    )
+
+
+@pytest.fixture
+def ensure_io(monkeypatch):
+    """
+    Stub the directory listing and renderer behind ``ensure_images_exist``.
+    
+    ``scandir`` reports an empty images/ directory unless a test sets its
+    ``return_value`` or ``side_effect``.
+    """
+    scandir = Mock(return_value=[])
+    save = Mock()
+    monkeypatch.setattr("agent.utils.os.scandir", scandir)
+    monkeypatch.setattr("agent.utils.save_graph_image", save)
+    return SimpleNamespace(scandir=scandir, save=save)
@@ -14,6 +14,15 @@ from agent.prompts import (
 )
 
 
+# Lowercase each prompt once at import instead of once per assertion
+_LOWERED = {
+    "research": RESEARCH_SYSTEM_MESSAGE.lower(),
+    "portfolio": PORTFOLIO_SYSTEM_MESSAGE.lower(),
+    "database": DATABASE_AGENT_SYSTEM_MESSAGE.lower(),
+    "supervisor": SUPERVISOR_SYSTEM_MESSAGE.lower(),
+}
+
+
 # ==================== Prompt Existence Tests ====================
 
 @pytest.mark.unit
@@ -90,21 +99,20 @@ class TestPromptContent:
         """Test that supervisor prompt is not empty."""
         assert len(SUPERVISOR_SYSTEM_MESSAGE) > 0
     
-    def test_research_prompt_mentions_research(self):
-        """Test that research prompt mentions research."""
-        assert 'research' in RESEARCH_SYSTEM_MESSAGE.lower() or 'search' in RESEARCH_SYSTEM_MESSAGE.lower()
-    
-    def test_portfolio_prompt_mentions_trading(self):
-        """Test that portfolio prompt mentions trading."""
-        assert 'portfolio' in PORTFOLIO_SYSTEM_MESSAGE.lower() or 'trading' in PORTFOLIO_SYSTEM_MESSAGE.lower()
-    
-    def test_database_prompt_mentions_database(self):
-        """Test that database prompt mentions database."""
-        assert 'database' in DATABASE_AGENT_SYSTEM_MESSAGE.lower() or 'order' in DATABASE_AGENT_SYSTEM_MESSAGE.lower()
-    
-    def test_supervisor_prompt_mentions_supervisor(self):
-        """Test that supervisor prompt mentions supervisor."""
-        assert 'supervisor' in SUPERVISOR_SYSTEM_MESSAGE.lower() or 'coordinate' in SUPERVISOR_SYSTEM_MESSAGE.lower()
+    @pytest.mark.parametrize(
+        "prompt_name,keywords",
+        [
+            ("research", ("research", "search")),
+            ("portfolio", ("portfolio", "trading")),
+            ("database", ("database", "order")),
+            ("supervisor", ("supervisor", "coordinate")),
+        ],
+        ids=["research", "portfolio", "database", "supervisor"]
+    )
+    def test_prompt_mentions_its_role(self, prompt_name, keywords):
+        """Test that each agent prompt mentions its role."""
+        prompt = _LOWERED[prompt_name]
+        assert any(keyword in prompt for keyword in keywords)
 
 
 # ==================== Prompt Format Tests ====================
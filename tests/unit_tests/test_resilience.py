@@ -5,20 +5,44 @@ Tests retry logic, circuit breakers, timeouts, and error handling.
 """
 
 import pytest
-import time
+import random
+import threading
 from unittest.mock import Mock, MagicMock, patch
 from agent.resilience import (
     RetryConfig,
     calculate_backoff_delay,
+    calculate_backoff_schedule,
     retry_with_backoff,
     CircuitBreaker,
     CircuitBreakerState,
+    CircuitBreakerOpenError,
     FallbackChain,
     RateLimiter,
     HealthCheck
 )
 
 
+class FakeClock:
+    """Virtual nanosecond monotonic clock advanced manually by tests."""
+    
+    def __init__(self):
+        self.t = 0
+    
+    def __call__(self):
+        return self.t
+    
+    def advance(self, seconds):
+        self.t += int(seconds * 1_000_000_000)
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    """Replace the resilience module clock with a FakeClock."""
+    clock = FakeClock()
+    monkeypatch.setattr("agent.resilience._clock", clock)
+    return clock
+
+
 # ==================== Retry Logic Tests ====================
 
 @pytest.mark.unit
@@ -60,6 +84,33 @@ class TestRetryLogic:
         
         # Should cap at max_delay
         assert calculate_backoff_delay(10, config) == 5.0
+        assert calculate_backoff_delay(3, config) == 5.0
+        assert calculate_backoff_delay(2, config) == 4.0
+    
+    def test_backoff_schedule_matches_scalar_delays(self):
+        """Test the schedule against the scalar calculation."""
+        config = RetryConfig(max_delay=5.0, jitter=False)
+        
+        sched = calculate_backoff_schedule(RetryConfig(jitter=False), 4)
+        assert sched == pytest.approx([1, 2, 4, 8])
+        
+        capped = calculate_backoff_schedule(config, 6)
+        expected = [calculate_backoff_delay(i, config) for i in range(6)]
+        assert capped == pytest.approx(expected)
+    
+    def test_backoff_full_jitter_within_bounds(self):
+        """Test that jittered delays stay between zero and the exponential cap."""
+        config = RetryConfig(
+            initial_delay=1.0,
+            max_delay=5.0,
+            exponential_base=2.0,
+            jitter=True
+        )
+        random.seed(1234)
+        
+        for attempt, expected in enumerate([1.0, 2.0, 4.0, 5.0, 5.0]):
+            delay = calculate_backoff_delay(attempt, config)
+            assert 0 <= delay <= expected
     
     def test_retry_success_on_first_attempt(self):
         """Test successful execution on first try."""
@@ -74,13 +125,9 @@ class TestRetryLogic:
         assert result == "success"
         assert mock_func.call_count == 1
     
-    def test_retry_success_after_failures(self):
+    def test_retry_success_after_failures(self, counting_raiser):
         """Test successful execution after retries."""
-        mock_func = Mock(side_effect=[
-            ConnectionError("Failed"),
-            ConnectionError("Failed"),
-            "success"
-        ])
+        mock_func = counting_raiser(ConnectionError, 2, then="success")
         
         @retry_with_backoff(
             retry_config=RetryConfig(max_retries=3, initial_delay=0.01),
@@ -127,6 +174,20 @@ class TestRetryLogic:
         # Should fail immediately, no retries
         assert mock_func.call_count == 1
     
+    def test_retry_accepts_single_exception_class(self, counting_raiser):
+        """Test that a bare exception class works like a one-element tuple."""
+        mock_func = counting_raiser(ConnectionError, 1, then="success")
+        
+        @retry_with_backoff(
+            retry_config=RetryConfig(max_retries=2, initial_delay=0.01),
+            retryable_exceptions=ConnectionError
+        )
+        def test_func():
+            return mock_func()
+        
+        assert test_func() == "success"
+        assert mock_func.call_count == 2
+    
     def test_retry_callback_invoked(self):
         """Test that on_retry callback is called."""
         callback_mock = Mock()
@@ -173,10 +234,24 @@ class TestCircuitBreaker:
         assert cb.state == CircuitBreakerState.CLOSED
         assert cb.failure_count == 0
     
-    def test_circuit_breaker_opens_after_threshold(self):
+    def test_circuit_breaker_success_clears_failure_streak(self, counting_raiser):
+        """Test a success in CLOSED state resets the failure count."""
+        cb = CircuitBreaker(failure_threshold=3, expected_exception=ValueError)
+        flaky = counting_raiser(ValueError, 2, then="success")
+        
+        for i in range(2):
+            with pytest.raises(ValueError):
+                cb.call(flaky)
+        
+        assert cb.failure_count == 2
+        assert cb.call(flaky) == "success"
+        assert cb.failure_count == 0
+        assert cb.state == CircuitBreakerState.CLOSED
+    
+    def test_circuit_breaker_opens_after_threshold(self, counting_raiser):
         """Test circuit breaker opens after failure threshold."""
         cb = CircuitBreaker(failure_threshold=3, expected_exception=ValueError)
-        mock_func = Mock(side_effect=ValueError("Error"))
+        mock_func = counting_raiser(ValueError, 3)
         
         # Trigger failures up to threshold
         for i in range(3):
@@ -186,14 +261,14 @@ class TestCircuitBreaker:
         assert cb.state == CircuitBreakerState.OPEN
         assert cb.failure_count == 3
     
-    def test_circuit_breaker_blocks_when_open(self):
+    def test_circuit_breaker_blocks_when_open(self, counting_raiser):
         """Test that circuit breaker blocks calls when OPEN."""
         cb = CircuitBreaker(
             failure_threshold=2,
             recovery_timeout=10.0,
             expected_exception=ValueError
         )
-        mock_func = Mock(side_effect=ValueError("Error"))
+        mock_func = counting_raiser(ValueError, 2)
         
         # Open the circuit
         for i in range(2):
@@ -203,10 +278,12 @@ class TestCircuitBreaker:
         assert cb.state == CircuitBreakerState.OPEN
         
         # Next call should be blocked
-        with pytest.raises(Exception, match="Circuit breaker.*is OPEN"):
+        with pytest.raises(CircuitBreakerOpenError):
             cb.call(mock_func)
+        
+        assert mock_func.call_count == 2
     
-    def test_circuit_breaker_half_open_recovery(self):
+    def test_circuit_breaker_half_open_recovery(self, fake_clock):
         """Test circuit breaker transitions to HALF_OPEN for recovery."""
         cb = CircuitBreaker(
             failure_threshold=2,
@@ -222,8 +299,8 @@ class TestCircuitBreaker:
         
         assert cb.state == CircuitBreakerState.OPEN
         
-        # Wait for recovery timeout
-        time.sleep(0.2)
+        # Advance past the recovery timeout
+        fake_clock.advance(0.2)
         
         # Next call should attempt HALF_OPEN
         mock_func = Mock(return_value="success")
@@ -232,6 +309,78 @@ class TestCircuitBreaker:
         assert result == "success"
         assert cb.state == CircuitBreakerState.CLOSED
     
+    def test_circuit_breaker_unexpected_probe_error_reopens(self, fake_clock):
+        """Test that a probe raising an unexpected exception reopens the circuit."""
+        cb = CircuitBreaker(
+            failure_threshold=1,
+            recovery_timeout=0.1,
+            expected_exception=ValueError
+        )
+        with pytest.raises(ValueError):
+            cb.call(Mock(side_effect=ValueError("Error")))
+        
+        fake_clock.advance(0.2)
+        with pytest.raises(KeyError):
+            cb.call(Mock(side_effect=KeyError("unexpected")))
+        
+        # Back to OPEN with a fresh timeout, and the probe slot is free again
+        assert cb.state == CircuitBreakerState.OPEN
+        with pytest.raises(CircuitBreakerOpenError):
+            cb.call(Mock(return_value="success"))
+        
+        fake_clock.advance(0.2)
+        assert cb.call(Mock(return_value="success")) == "success"
+        assert cb.state == CircuitBreakerState.CLOSED
+    
+    def test_circuit_breaker_half_open_single_probe(self):
+        """Test that only one recovery probe is admitted while HALF_OPEN."""
+        cb = CircuitBreaker(
+            failure_threshold=1,
+            recovery_timeout=0.0,
+            expected_exception=ValueError
+        )
+        with pytest.raises(ValueError):
+            cb.call(Mock(side_effect=ValueError("Error")))
+        
+        assert cb.state == CircuitBreakerState.OPEN
+        
+        probe_started = threading.Event()
+        release_probe = threading.Event()
+        probe_calls = []
+        results = []
+        
+        def probe():
+            probe_calls.append(1)
+            probe_started.set()
+            release_probe.wait(1)
+            return "success"
+        
+        def worker():
+            try:
+                results.append(cb.call(probe))
+            except Exception as e:
+                results.append(e)
+        
+        first = threading.Thread(target=worker)
+        first.start()
+        assert probe_started.wait(1)
+        
+        others = [threading.Thread(target=worker) for _ in range(9)]
+        for thread in others:
+            thread.start()
+        for thread in others:
+            thread.join()
+        
+        release_probe.set()
+        first.join()
+        
+        assert len(probe_calls) == 1
+        assert results.count("success") == 1
+        rejected = [r for r in results if r != "success"]
+        assert all(isinstance(r, CircuitBreakerOpenError) for r in rejected)
+        assert all("in flight" in str(r) for r in rejected)
+        assert cb.state == CircuitBreakerState.CLOSED
+    
     def test_circuit_breaker_manual_reset(self):
         """Test manual reset of circuit breaker."""
         cb = CircuitBreaker(failure_threshold=2, expected_exception=ValueError)
@@ -331,7 +480,13 @@ class TestRateLimiter:
         # Block 4th call
         assert limiter.is_allowed() is False
     
-    def test_rate_limiter_resets_after_window(self):
+    @pytest.mark.parametrize("time_window", [0, -1.0, 1e-10], ids=["zero", "negative", "sub_ns"])
+    def test_rate_limiter_rejects_non_positive_window(self, time_window):
+        """Test that a window too short to refill the bucket is rejected."""
+        with pytest.raises(ValueError, match="time_window must be positive"):
+            RateLimiter(max_calls=5, time_window=time_window)
+    
+    def test_rate_limiter_resets_after_window(self, fake_clock):
         """Test rate limiter resets after time window."""
         limiter = RateLimiter(max_calls=2, time_window=0.1)
         
@@ -340,11 +495,26 @@ class TestRateLimiter:
         assert limiter.is_allowed() is True
         assert limiter.is_allowed() is False
         
-        # Wait for window to pass
-        time.sleep(0.15)
+        # Advance past the window
+        fake_clock.advance(0.15)
         
         # Should allow again
         assert limiter.is_allowed() is True
+    
+    def test_rate_limiter_refills_proportionally(self, fake_clock):
+        """Test the bucket refills exactly in proportion to elapsed time."""
+        limiter = RateLimiter(max_calls=2, time_window=0.1)
+        
+        assert limiter.is_allowed() is True
+        assert limiter.is_allowed() is True
+        assert limiter.tokens == 0.0
+        
+        # Half a window refills exactly one token
+        fake_clock.advance(0.05)
+        
+        assert limiter.is_allowed() is True
+        assert limiter.tokens == 0.0
+        assert limiter.is_allowed() is False
 
 
 # ==================== Health Check Tests ====================
@@ -353,12 +523,12 @@ class TestRateLimiter:
 class TestHealthCheck:
     """Test health check functionality."""
     
-    def test_health_check_register_and_run(self):
+    def test_health_check_register_and_run(self, ok_check, counting_callable):
         """Test registering and running health checks."""
         health = HealthCheck()
         
-        check1 = Mock(return_value=True)
-        check2 = Mock(return_value=True)
+        check1 = counting_callable(ok_check)
+        check2 = counting_callable(ok_check)
         
         health.register("component1", check1)
         health.register("component2", check2)
@@ -369,35 +539,88 @@ class TestHealthCheck:
         assert check1.call_count == 1
         assert check2.call_count == 1
     
-    def test_health_check_handles_failures(self):
+    def test_health_check_handles_failures(self, ok_check, fail_check):
         """Test health check handles component failures."""
         health = HealthCheck()
         
-        check1 = Mock(return_value=True)
-        check2 = Mock(side_effect=Exception("Component failed"))
-        
-        health.register("component1", check1)
-        health.register("component2", check2)
+        health.register("component1", ok_check)
+        health.register("component2", fail_check, expected_exceptions=(Exception,))
         
         results = health.run_all()
         
         assert results["component1"] is True
         assert results["component2"] is False
     
-    def test_is_healthy_all_pass(self):
+    def test_health_check_unexpected_exception_propagates(self, fail_check):
+        """Test that exceptions outside expected_exceptions are not swallowed."""
+        health = HealthCheck()
+        
+        health.register("component1", fail_check, expected_exceptions=(ConnectionError,))
+        
+        with pytest.raises(RuntimeError):
+            health.run_all()
+    
+    def test_health_check_reregister_replaces_check(self, ok_check):
+        """Test registering an existing name replaces the previous check."""
+        health = HealthCheck()
+        
+        health.register("component1", lambda: False)
+        health.register("component2", ok_check)
+        health.register("component1", ok_check)
+        
+        assert list(health.checks) == ["component1", "component2"]
+        assert health.run_all() == {"component1": True, "component2": True}
+    
+    def test_is_healthy_all_pass(self, ok_check):
         """Test is_healthy when all checks pass."""
         health = HealthCheck()
         
-        health.register("component1", Mock(return_value=True))
-        health.register("component2", Mock(return_value=True))
+        health.register("component1", ok_check)
+        health.register("component2", ok_check)
         
         assert health.is_healthy() is True
     
-    def test_is_healthy_with_failures(self):
+    def test_is_healthy_with_failures(self, ok_check):
         """Test is_healthy when some checks fail."""
         health = HealthCheck()
         
-        health.register("component1", Mock(return_value=True))
-        health.register("component2", Mock(return_value=False))
+        health.register("component1", ok_check)
+        health.register("component2", lambda: False)
+        
+        assert health.is_healthy() is False
+    
+    def test_is_healthy_stops_at_first_failure(self, ok_check, counting_callable):
+        """Test is_healthy skips checks registered after a failing one."""
+        health = HealthCheck()
+        later_check = counting_callable(ok_check)
+        
+        health.register("liveness", lambda: False)
+        health.register("database", later_check)
         
         assert health.is_healthy() is False
+        assert later_check.call_count == 0
+    
+    def test_checks_registered_after_first_run_still_run_concurrently(self, ok_check):
+        """Test that the pool is not sized by the checks present at the first run."""
+        health = HealthCheck()
+        health.register("component1", ok_check)
+        health.run_all()
+        
+        # Each check waits for the other; a one-worker pool would time out
+        barrier = threading.Barrier(2, timeout=2)
+        health.register("component2", lambda: barrier.wait() is not None)
+        health.register("component3", lambda: barrier.wait() is not None)
+        
+        assert health.run_all() == {"component1": True, "component2": True, "component3": True}
+        health.close()
+    
+    def test_health_check_close_allows_rerun(self, ok_check):
+        """Test that closing the worker pool does not break later runs."""
+        health = HealthCheck()
+        health.register("component1", ok_check)
+        
+        assert health.run_all() == {"component1": True}
+        
+        health.close()
+        
+        assert health.run_all() == {"component1": True}
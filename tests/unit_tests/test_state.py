@@ -53,6 +53,31 @@ class TestStateCreation:
         
         assert len(state["messages"]) >= 2
 
+    
+    def test_initial_state_defaults(self):
+        """Test that get_initial_state returns the documented defaults."""
+        state = get_initial_state()
+        
+        assert isinstance(state, dict)
+        assert state["messages"] == []
+        assert state["agent_call_history"] == []
+        assert state["iteration_count"] == 0
+        assert state["max_iterations"] == 50
+        assert state["last_agent"] is None
+        assert state["loop_detected"] is False
+        assert state["execution_time"] == 0.0
+        assert isinstance(state["start_timestamp"], float)
+    
+    def test_initial_state_lists_are_not_shared(self):
+        """Test that each initial state gets its own mutable lists."""
+        first = get_initial_state()
+        second = get_initial_state()
+        
+        first["messages"].append(HumanMessage(content="Hello"))
+        first["agent_call_history"].append("research_agent")
+        
+        assert second["messages"] == []
+        assert second["agent_call_history"] == []
 
 # ==================== State Type Tests ====================
 
@@ -162,6 +187,7 @@ class TestMessageHandling:
         )
         assert hasattr(msg, 'tool_calls')
         assert len(msg.tool_calls) == 1
+        assert msg.tool_calls[0]["args"] == {}
     
     def test_messages_have_type_attribute(self):
         """Test that messages have type attribute."""
@@ -7,9 +7,8 @@ Tests graph visualization, message printing, and helper utilities.
 import pytest
 import os
 import tempfile
-from unittest.mock import Mock, patch, MagicMock, mock_open, call
+from types import SimpleNamespace
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
-from langgraph.types import Command
 from agent.utils import (
     save_graph_image,
     get_graph_image_bytes,
@@ -20,29 +19,40 @@ from agent.utils import (
 )
 
 
+# Static messages shared by the tests below; pydantic validation runs once at
+# import instead of in every test. print_messages only reads them.
+_HUMAN = HumanMessage(content="Hello")
+_AI = AIMessage(content="Hi there!")
+_TOOL = ToolMessage(content="Tool result", tool_call_id="123")
+_AI_WITH_CALLS = AIMessage(
+    content="",
+    tool_calls=[{"name": "test_tool", "args": {"param": "value"}, "id": "call_123"}]
+)
+_CONVERSATION = (
+    HumanMessage(content="What's the stock price?"),
+    AIMessage(content="Let me check that for you."),
+    ToolMessage(content="AAPL: $150.25", tool_call_id="1"),
+    AIMessage(content="The stock price is $150.25"),
+)
+
+
 # ==================== Graph Visualization Tests ====================
 
 @pytest.mark.unit
 class TestGraphVisualization:
     """Test graph visualization utilities."""
     
-    @patch('agent.utils.os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_save_graph_image_creates_directory(self, mock_file, mock_makedirs):
+    def test_save_graph_image_creates_directory(self, graph_io, make_mock_graph):
         """Test that save_graph_image creates images directory."""
-        mock_graph = MagicMock()
-        mock_graph.get_graph.return_value.draw_mermaid_png.return_value = b'fake_png_data'
+        mock_graph = make_mock_graph(b'fake_png_data')
         
         save_graph_image(mock_graph, "test_graph")
         
-        mock_makedirs.assert_called_once_with("images", exist_ok=True)
+        graph_io.makedirs.assert_called_once_with("images", exist_ok=True)
     
-    @patch('agent.utils.os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_save_graph_image_returns_filepath(self, mock_file, mock_makedirs):
+    def test_save_graph_image_returns_filepath(self, graph_io, make_mock_graph):
         """Test that save_graph_image returns filepath on success."""
-        mock_graph = MagicMock()
-        mock_graph.get_graph.return_value.draw_mermaid_png.return_value = b'fake_png_data'
+        mock_graph = make_mock_graph(b'fake_png_data')
         
         result = save_graph_image(mock_graph, "test_graph")
         
@@ -50,24 +60,20 @@ class TestGraphVisualization:
         assert isinstance(result, str)
         assert "test_graph" in result
     
-    @patch('agent.utils.os.makedirs')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_save_graph_image_writes_png_data(self, mock_file, mock_makedirs):
+    def test_save_graph_image_writes_png_data(self, graph_io, make_mock_graph):
         """Test that save_graph_image writes PNG data."""
-        mock_graph = MagicMock()
         png_data = b'fake_png_data'
-        mock_graph.get_graph.return_value.draw_mermaid_png.return_value = png_data
+        mock_graph = make_mock_graph(png_data)
         
         save_graph_image(mock_graph, "test_graph")
         
         # Verify write was called with PNG data
-        mock_file.return_value.write.assert_called_once_with(png_data)
+        graph_io.open.return_value.write.assert_called_once_with(png_data)
     
-    @patch('agent.utils.os.makedirs')
-    @patch('agent.utils._generate_svg_fallback')
-    def test_save_graph_image_uses_svg_fallback_on_png_failure(self, mock_svg_fallback, mock_makedirs):
+    def test_save_graph_image_uses_svg_fallback_on_png_failure(self, mocker, graph_io, make_mock_graph):
         """Test that SVG fallback is used when PNG generation fails."""
-        mock_graph = MagicMock()
+        mock_svg_fallback = mocker.patch('agent.utils._generate_svg_fallback')
+        mock_graph = make_mock_graph()
         mock_graph.get_graph.return_value.draw_mermaid_png.side_effect = Exception("PNG failed")
         mock_svg_fallback.return_value = "images/test_graph.svg"
         
@@ -75,27 +81,78 @@ class TestGraphVisualization:
         
         mock_svg_fallback.assert_called_once()
     
-    def test_get_graph_image_bytes_returns_bytes_or_none(self):
+    def test_save_graph_image_publishes_atomically(self, graph_io, make_mock_graph):
+        """Test that the PNG is written to a temp file and moved into place."""
+        save_graph_image(make_mock_graph(), "test_graph")
+        
+        tmp_path = graph_io.open.call_args.args[0]
+        assert tmp_path.startswith("images/test_graph.png.") and tmp_path.endswith(".tmp")
+        graph_io.replace.assert_called_once_with(tmp_path, "images/test_graph.png")
+    
+    def test_save_graph_image_without_force_keeps_existing_png(self, graph_io, make_mock_graph):
+        """Test that force=False returns a non-empty existing PNG without rendering."""
+        graph_io.stat.side_effect = None
+        graph_io.stat.return_value = SimpleNamespace(st_size=1024)
+        mock_graph = make_mock_graph()
+        
+        result = save_graph_image(mock_graph, "test_graph", force=False)
+        
+        assert result == "images/test_graph.png"
+        mock_graph.get_graph.assert_not_called()
+        graph_io.open.assert_not_called()
+    
+    def test_save_graph_image_without_force_rerenders_empty_png(self, graph_io, make_mock_graph):
+        """Test that a 0-byte leftover PNG is treated as missing and replaced."""
+        graph_io.stat.side_effect = None
+        graph_io.stat.return_value = SimpleNamespace(st_size=0)
+        graph_io.link.side_effect = FileExistsError
+        mock_graph = make_mock_graph()
+        
+        result = save_graph_image(mock_graph, "test_graph", force=False)
+        
+        assert result == "images/test_graph.png"
+        mock_graph.get_graph.assert_called()
+        graph_io.replace.assert_called_once()
+    
+    def test_save_graph_image_without_force_keeps_concurrent_png(self, graph_io, make_mock_graph):
+        """Test that a PNG published by another writer mid-render is not clobbered."""
+        graph_io.stat.side_effect = [FileNotFoundError(), SimpleNamespace(st_size=1024)]
+        graph_io.link.side_effect = FileExistsError
+        
+        result = save_graph_image(make_mock_graph(), "test_graph", force=False)
+        
+        assert result == "images/test_graph.png"
+        graph_io.replace.assert_not_called()
+        graph_io.remove.assert_called_once_with(graph_io.link.call_args.args[0])
+    
+    def test_save_graph_image_without_force_leaves_no_file_on_failure(self, mocker, graph_io, make_mock_graph):
+        """Test that a failed render never publishes a PNG."""
+        mocker.patch('agent.utils._generate_svg_fallback', return_value="images/test_graph.svg")
+        mock_graph = make_mock_graph()
+        mock_graph.get_graph.return_value.draw_mermaid_png.side_effect = Exception("PNG failed")
+        
+        result = save_graph_image(mock_graph, "test_graph", max_retries=1, force=False)
+        
+        graph_io.open.assert_not_called()
+        graph_io.link.assert_not_called()
+        assert result == "images/test_graph.svg"
+    
+    def test_get_graph_image_bytes_returns_bytes_or_none(self, make_mock_graph):
         """Test that get_graph_image_bytes returns bytes or None."""
-        mock_graph = MagicMock()
-        mock_graph.get_graph.return_value.draw_mermaid_png.return_value = b'fake_png_data'
+        mock_graph = make_mock_graph(b'fake_png_data')
         
         result = get_graph_image_bytes(mock_graph)
         
         assert result is None or isinstance(result, bytes)
     
-    def test_multiple_graph_saves(self):
+    def test_multiple_graph_saves(self, graph_io, make_mock_graph):
         """Test saving multiple graphs."""
-        mock_graph1 = MagicMock()
-        mock_graph2 = MagicMock()
-        mock_graph1.get_graph.return_value.draw_mermaid_png.return_value = b'png1'
-        mock_graph2.get_graph.return_value.draw_mermaid_png.return_value = b'png2'
+        mock_graph1 = make_mock_graph(b'png1')
+        mock_graph2 = make_mock_graph(b'png2')
         
-        with patch('builtins.open', mock_open()):
-            with patch('agent.utils.os.makedirs'):
-                # Save multiple graphs
-                save_graph_image(mock_graph1, "graph1")
-                save_graph_image(mock_graph2, "graph2")
+        # Save multiple graphs
+        save_graph_image(mock_graph1, "graph1")
+        save_graph_image(mock_graph2, "graph2")
         
         # Both should be called
         assert mock_graph1.get_graph.called
@@ -108,89 +165,46 @@ class TestGraphVisualization:
 class TestMessagePrinting:
     """Test message printing utilities."""
     
-    def test_print_messages_with_empty_list(self):
+    def test_print_messages_with_empty_list(self, capsys):
         """Test print_messages with empty list."""
-        # Should not raise exception
-        try:
-            print_messages([])
-            success = True
-        except Exception:
-            success = False
-        
-        assert success
+        print_messages([])
+        
+        assert capsys.readouterr().out == ""
     
-    def test_print_messages_with_human_message(self):
+    def test_print_messages_with_human_message(self, capsys):
         """Test print_messages with HumanMessage."""
-        messages = [HumanMessage(content="Hello")]
-        
-        try:
-            print_messages(messages)
-            success = True
-        except Exception:
-            success = False
+        print_messages([_HUMAN])
         
-        assert success
+        assert "Hello" in capsys.readouterr().out
     
-    def test_print_messages_with_ai_message(self):
+    def test_print_messages_with_ai_message(self, capsys):
         """Test print_messages with AIMessage."""
-        messages = [AIMessage(content="Hi there!")]
-        
-        try:
-            print_messages(messages)
-            success = True
-        except Exception:
-            success = False
+        print_messages([_AI])
         
-        assert success
+        assert "Hi there!" in capsys.readouterr().out
     
-    def test_print_messages_with_tool_message(self):
+    def test_print_messages_with_tool_message(self, capsys):
         """Test print_messages with ToolMessage."""
-        messages = [ToolMessage(content="Tool result", tool_call_id="123")]
+        print_messages([_TOOL])
         
-        try:
-            print_messages(messages)
-            success = True
-        except Exception:
-            success = False
-        
-        assert success
+        out = capsys.readouterr().out
+        assert "Tool Message" in out
+        assert "Tool result" in out
     
-    def test_print_messages_with_mixed_messages(self):
+    def test_print_messages_with_mixed_messages(self, capsys):
         """Test print_messages with mixed message types."""
-        messages = [
-            HumanMessage(content="Question"),
-            AIMessage(content="Answer"),
-            ToolMessage(content="Result", tool_call_id="123")
-        ]
-        
-        try:
-            print_messages(messages)
-            success = True
-        except Exception:
-            success = False
-        
-        assert success
+        print_messages([_HUMAN, _AI, _TOOL])
+        
+        out = capsys.readouterr().out
+        assert out.index("Hello") < out.index("Hi there!") < out.index("Tool result")
     
-    def test_print_messages_handles_tool_calls(self):
+    def test_print_messages_handles_tool_calls(self, capsys):
         """Test print_messages handles AI messages with tool calls."""
-        ai_message = AIMessage(
-            content="",
-            tool_calls=[
-                {
-                    "name": "test_tool",
-                    "args": {"param": "value"},
-                    "id": "call_123"
-                }
-            ]
-        )
-        
-        try:
-            print_messages([ai_message])
-            success = True
-        except Exception:
-            success = False
+        print_messages([_AI_WITH_CALLS])
         
-        assert success
+        out = capsys.readouterr().out
+        assert "test_tool" in out
+        assert "call_123" in out
 
 
 # ==================== Helper Function Tests ====================
@@ -199,32 +213,27 @@ class TestMessagePrinting:
 class TestHelperFunctions:
     """Test helper utility functions."""
     
-    def test_graph_visualization_with_retry(self):
+    def test_graph_visualization_with_retry(self, mocker, graph_io, make_mock_graph, counting_raiser):
         """Test graph visualization retry logic."""
-        mock_graph = MagicMock()
+        mock_graph = make_mock_graph()
         # First call fails, second succeeds
-        mock_graph.get_graph.return_value.draw_mermaid_png.side_effect = [
-            Exception("Temporary failure"),
-            b'fake_png_data'
-        ]
+        draw = counting_raiser(Exception, 1, then=b'fake_png_data')
+        mock_graph.get_graph.return_value.draw_mermaid_png.side_effect = draw
         
-        with patch('builtins.open', mock_open()):
-            with patch('agent.utils.os.makedirs'):
-                result = save_graph_image(mock_graph, "test_graph", max_retries=2)
+        mock_sleep = mocker.patch('agent.utils.time.sleep')
         
-        # Should eventually succeed
-        assert result is not None or result is None  # Either succeeds or falls back
+        result = save_graph_image(mock_graph, "test_graph", max_retries=2)
+        
+        # Should back off once, then succeed without falling back to SVG
+        assert draw.call_count == 2
+        mock_sleep.assert_called_once()
+        assert result == "images/test_graph.png"
+        graph_io.open.return_value.write.assert_called_once_with(b'fake_png_data')
     
     def test_message_content_extraction(self):
         """Test extracting content from different message types."""
-        messages = [
-            HumanMessage(content="Human message"),
-            AIMessage(content="AI response"),
-            ToolMessage(content="Tool output", tool_call_id="123")
-        ]
-        
         # Verify messages have content
-        for msg in messages:
+        for msg in (_HUMAN, _AI, _TOOL):
             assert hasattr(msg, 'content')
             assert isinstance(msg.content, str)
     
@@ -244,49 +253,33 @@ class TestHelperFunctions:
 class TestUtilsIntegration:
     """Test utils integration scenarios."""
     
-    def test_complete_visualization_workflow(self):
+    def test_complete_visualization_workflow(self, graph_io, make_mock_graph):
         """Test complete visualization workflow."""
-        mock_graph = MagicMock()
-        mock_graph.get_graph.return_value.draw_mermaid_png.return_value = b'png_data'
-        
-        with patch('builtins.open', mock_open()):
-            with patch('agent.utils.os.makedirs'):
-                # Save graph image
-                filepath = save_graph_image(mock_graph, "workflow_test")
-                
-                # Should return a path
-                assert filepath is None or isinstance(filepath, str)
+        mock_graph = make_mock_graph(b'png_data')
+        
+        # Save graph image
+        filepath = save_graph_image(mock_graph, "workflow_test")
+        
+        # Should return a path
+        assert filepath is None or isinstance(filepath, str)
     
-    def test_message_flow_simulation(self):
+    def test_message_flow_simulation(self, capsys):
         """Test simulating a message flow."""
-        conversation = [
-            HumanMessage(content="What's the stock price?"),
-            AIMessage(content="Let me check that for you."),
-            ToolMessage(content="AAPL: $150.25", tool_call_id="1"),
-            AIMessage(content="The stock price is $150.25")
-        ]
-        
         # Should be able to process full conversation
-        try:
-            print_messages(conversation)
-            success = True
-        except Exception:
-            success = False
+        print_messages(_CONVERSATION)
         
-        assert success
+        out = capsys.readouterr().out
+        assert "What's the stock price?" in out
+        assert "AAPL: $150.25" in out
+        assert "The stock price is $150.25" in out
     
-    def test_batch_visualization_generation(self):
+    def test_batch_visualization_generation(self, graph_io, make_mock_graph):
         """Test generating multiple visualizations."""
-        graphs = [MagicMock() for _ in range(4)]
-        
-        for graph in graphs:
-            graph.get_graph.return_value.draw_mermaid_png.return_value = b'png_data'
+        graphs = [make_mock_graph(b'png_data') for _ in range(4)]
         
-        with patch('builtins.open', mock_open()):
-            with patch('agent.utils.os.makedirs'):
-                # Simulate saving multiple graphs
-                for i, graph in enumerate(graphs):
-                    save_graph_image(graph, f"graph_{i}")
+        # Simulate saving multiple graphs
+        for i, graph in enumerate(graphs):
+            save_graph_image(graph, f"graph_{i}")
         
         # All graphs should have been called
         for graph in graphs:
@@ -299,23 +292,17 @@ class TestUtilsIntegration:
 class TestAgentHandoffTool:
     """Test agent handoff tool creation and functionality."""
     
-    def test_normalize_agent_name_basic(self):
-        """Test basic agent name normalization."""
-        assert _normalize_agent_name("Database Agent") == "database_agent"
-        assert _normalize_agent_name("Research Agent") == "research_agent"
-        assert _normalize_agent_name("Portfolio Manager") == "portfolio_manager"
-    
-    def test_normalize_agent_name_with_multiple_spaces(self):
-        """Test normalization with multiple spaces."""
-        assert _normalize_agent_name("My  Special   Agent") == "my__special___agent"
-    
-    def test_normalize_agent_name_already_lowercase(self):
-        """Test normalization when already lowercase."""
-        assert _normalize_agent_name("database_agent") == "database_agent"
-    
-    def test_normalize_agent_name_uppercase(self):
-        """Test normalization with uppercase."""
-        assert _normalize_agent_name("DATABASE") == "database"
+    @pytest.mark.parametrize("raw,expected", [
+        ("Database Agent", "database_agent"),
+        ("Research Agent", "research_agent"),
+        ("Portfolio Manager", "portfolio_manager"),
+        ("My  Special   Agent", "my__special___agent"),
+        ("database_agent", "database_agent"),
+        ("DATABASE", "database"),
+    ])
+    def test_normalize_agent_name(self, raw, expected):
+        """Test agent name normalization to snake_case tool names."""
+        assert _normalize_agent_name(raw) == expected
     
     def test_create_handoff_tool_default_name(self):
         """Test creating handoff tool with default name."""
@@ -352,10 +339,10 @@ class TestAgentHandoffTool:
         assert hasattr(tool, 'description')
         assert callable(tool)
     
-    @patch('agent.utils.ToolMessage')
-    @patch('agent.utils.Command')
-    def test_handoff_tool_execution(self, mock_command, mock_tool_message):
+    def test_handoff_tool_execution(self, mocker):
         """Test executing handoff tool."""
+        mock_command = mocker.patch('agent.utils.Command')
+        mock_tool_message = mocker.patch('agent.utils.ToolMessage')
         tool = create_handoff_tool(agent_name="Database Agent")
         
         # Mock state and tool_call_id